@@ -2,27 +2,33 @@
 import pandas as pd
 import geopandas as gpd
 
+from FINAL.derived_metrics import to_country_data
+from FINAL.metric_registry import DEFAULT_METRICS, KEY_COLUMNS, METRICS, get_columns
+from FINAL.modified_tree_FINAL import TIME_LEVELS, Tree, get_period_ends, validate_covid_columns
 
-def clean_data(file_path: str) -> None:
+
+def read_metric_columns(file_path: str, metrics: tuple[str, ...]) -> pd.DataFrame:
     """
-    Function to clean the data from the csv file.
-    Return None.
+    Function to read and clean the columns of the given registered metrics from the csv file.
+    Only these columns and the KEY_COLUMNS are read from disk. Values which are not numbers are
+    left missing (NaN) rather than failing the read, and are quarantined when the data is validated.
+    Return the cleaned data.
     """
-    covid = pd.read_csv(file_path)
+    metric_columns = get_columns(metrics)
+    # only empty values are read as missing, as in validate_covid_data, so that e.g. 'n/a' is malformed rather than 0
+    covid = pd.read_csv(file_path, usecols=KEY_COLUMNS + metric_columns, keep_default_na=False, na_values=[''])
 
-    new_covid = covid[['iso_code', 'continent', 'location', 'date',
-                       'total_cases', 'total_deaths', 'total_vaccinations',
-                       'population']]
+    new_covid = covid[KEY_COLUMNS + metric_columns].copy()
 
-    new_covid['total_cases'] = new_covid['total_cases'].fillna(0)
-    new_covid['total_deaths'] = new_covid['total_deaths'].fillna(0)
-    new_covid['total_vaccinations'] = new_covid['total_vaccinations'].fillna(0)
+    fill_cols = [METRICS[name].column for name in metrics if METRICS[name].fill_missing]
+    new_covid[fill_cols] = new_covid[fill_cols].fillna(0)
 
-    #
+    # only the empty values are filled, so a malformed value is still missing once it is converted to a number
+    new_covid[metric_columns] = new_covid[metric_columns].apply(pd.to_numeric, errors='coerce')
 
-    int_cols = ['total_cases', 'total_deaths',
-                'total_vaccinations', 'population']
-    new_covid[int_cols] = new_covid[int_cols].astype(int)
+    int_cols = [METRICS[name].column for name in metrics if METRICS[name].integer]
+    whole_cols = [column for column in int_cols if (new_covid[column] % 1 == 0).all()]
+    new_covid[whole_cols] = new_covid[whole_cols].astype(int)
 
     new_covid_final = new_covid.dropna(subset=['continent', 'location'])
 
@@ -40,11 +46,61 @@ def clean_data(file_path: str) -> None:
 
     new_covid_final = (
         new_covid_final)[new_covid_final['location'] != 'W. Sahara']
-    new_covid_final['location'].replace("Côte d'Ivoire",
-                                        "Cote d'Ivoire", inplace=True)
+    new_covid_final['location'] = new_covid_final['location'].replace("Côte d'Ivoire",
+                                                                      "Cote d'Ivoire")
+    return new_covid_final
+
+
+def clean_data(file_path: str, metrics: tuple[str, ...] = DEFAULT_METRICS) -> None:
+    """
+    Function to clean the data from the csv file, keeping only the columns of the given registered metrics.
+    Return None.
+    """
+    new_covid_final = read_metric_columns(file_path, metrics)
     new_covid_final.to_csv("FINAL/FINAL_TESTING_filtered_data_1.csv", index=False)
 
 
+def load_metrics(covid_tree: Tree, file_path: str, metrics: tuple[str, ...]) -> pd.DataFrame:
+    """
+    Function to add the given registered metrics to the COVID data of each country in covid_tree,
+    reading only their columns from the csv file. This is used to load optional metrics on demand,
+    without cleaning and rebuilding the whole tree.
+    The rows are validated by validate_covid_columns, like those of build_covid_tree, so a row
+    with a malformed value is left out rather than failing the load.
+    Return the quarantine report of the rows which failed validation.
+
+    In this example the total tests, which are carried forward, are missing (0) on the last day of January 2021,
+    and the stringency index of the first day of February 2021 is malformed.
+
+    >>> import os
+    >>> import tempfile
+    >>> owid_file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+    >>> owid_file.close()
+    >>> pd.DataFrame({'iso_code': 'IND', 'continent': 'Asia', 'location': 'India',
+    ...               'date': ['2021-01-30', '2021-01-31', '2021-02-01', '2021-02-02'], 'total_tests': [10, 0, 30, 40],
+    ...               'stringency_index': ['50.0', '60.0', 'x', '70.0']}).to_csv(owid_file.name, index=False)
+    >>> india = Tree('India', [Tree({'January 2021': {'Total cases': 1}, 'February 2021': {'Total cases': 2}}, [])])
+    >>> covid_tree = Tree('World', [Tree('Asia', [india])])
+    >>> quarantine = load_metrics(covid_tree, owid_file.name, ('Total tests', 'Stringency index'))
+    >>> os.remove(owid_file.name)
+    >>> quarantine[['line', 'reason']].values.tolist()
+    [[4, 'malformed stringency_index']]
+    >>> covid_tree.get_country_data()['India']['January 2021']
+    {'Total cases': 1, 'Total tests': 10, 'Stringency index': 60.0}
+    >>> covid_tree.get_country_data()['India']['February 2021']
+    {'Total cases': 2, 'Total tests': 40, 'Stringency index': 70.0}
+    """
+    covid = read_metric_columns(file_path, metrics).sort_values(['location', 'date'], kind='stable')
+    # the rows are indexed by their position in the csv file, so the quarantine report has their line numbers.
+    # The metrics which are carried forward are carried forward by the validation
+    covid, quarantine = validate_covid_columns(covid.set_index('index'), metrics)
+
+    pyramid = pd.concat([get_period_ends(covid, level) for level in TIME_LEVELS])
+    pyramid = pyramid.rename(columns={METRICS[name].column: name for name in metrics})
+    covid_tree.update_country_data(to_country_data(pyramid.set_index(['location', 'period'])[list(metrics)]))
+    return quarantine
+
+
 if __name__ == '__main__':
     # import python_ta.contracts
     #
@@ -58,5 +114,6 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['geopandas', 'pandas']
+        'extra-imports': ['geopandas', 'pandas', 'FINAL.derived_metrics', 'FINAL.metric_registry',
+                          'FINAL.modified_tree_FINAL']
     })
@@ -0,0 +1,139 @@
+"""
+This module computes derived COVID metrics (new cases and deaths, rolling averages, growth, case fatality ratio and
+doses per hundred) from the validated COVID data, and stores them in the COVID data Tree.
+
+All metrics are computed for every country and period of the time pyramid in one vectorized pass over the panel of
+daily rows, using grouped pandas operations rather than a Python loop per country. The panel is the one returned by
+validate_covid_data, which is also used to build the Tree, so the csv file is only read and validated once.
+Once added to the Tree, the derived metrics are stored alongside the totals in each country's COVID data dictionary:
+{<period>: {'Total cases': <cases>, ..., 'New cases': <new cases>, 'Case fatality ratio': <ratio>, ...}}
+and can be queried with Tree.get_metric.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import pandas as pd
+
+from FINAL.modified_tree_FINAL import TIME_LEVELS, Tree, get_period_ends
+
+DERIVED_METRICS = ['New cases', 'New deaths',
+                   'New cases (7-day avg)', 'New cases (28-day avg)',
+                   'New deaths (7-day avg)', 'New deaths (28-day avg)',
+                   'Weekly case growth', 'Case fatality ratio', 'Doses per hundred']
+
+
+# @check_contracts
+def compute_derived_metrics(covid: pd.DataFrame, levels: tuple[str, ...] = tuple(TIME_LEVELS)) -> pd.DataFrame:
+    """Return a DataFrame indexed by (country, period) containing every metric in DERIVED_METRICS for every
+    country in covid, the rows returned by validate_covid_data, and every period of the given levels of the time
+    pyramid.
+
+    The values of a period are those of the last day recorded in that period, except for 'New cases' and 'New deaths',
+    which are the number of cases and deaths recorded during the period.
+
+    Preconditions:
+        - covid was returned by validate_covid_data for the DEFAULT_METRICS (or more)
+        - all(level in TIME_LEVELS for level in levels)
+
+    In this panel 1 case is recorded every day of the first week of 2021 and 2 cases every day of the second week,
+    so the 7-day average doubles and the cases grow by 100% from one week to the next.
+
+    >>> cases = [day if day <= 7 else 2 * day - 7 for day in range(1, 15)]
+    >>> covid = pd.DataFrame({'continent': 'Asia', 'location': 'India',
+    ...                       'date': [f'2021-01-{day:02}' for day in range(1, 15)], 'total_cases': cases,
+    ...                       'total_deaths': [0] * 13 + [7], 'total_vaccinations': 50, 'population': 200})
+    >>> metrics = compute_derived_metrics(covid, ('day', 'month'))
+    >>> columns = ['New cases (7-day avg)', 'New cases (28-day avg)', 'Weekly case growth']
+    >>> metrics.loc[('India', '2021-01-07'), columns].tolist()
+    [1.0, 1.0, 0.0]
+    >>> metrics.loc[('India', '2021-01-14'), columns].tolist()
+    [2.0, 1.5, 1.0]
+    >>> metrics.loc[('India', 'January 2021'), ['New cases', 'Case fatality ratio', 'Doses per hundred']].tolist()
+    [21.0, 0.3333333333333333, 25.0]
+
+    The windows are measured in calendar days, so the averages are the same when a day is missing.
+
+    >>> gappy_metrics = compute_derived_metrics(covid[covid['date'] != '2021-01-04'], ('day',))
+    >>> gappy_metrics.loc[('India', '2021-01-07'), columns].tolist()
+    [1.0, 1.0, 0.0]
+    >>> gappy_metrics.loc[('India', '2021-01-14'), columns].tolist()
+    [2.0, 1.5, 1.0]
+    """
+    # the same rows as are stored in the Tree, with the vaccination totals already carried forward. The rows of each
+    # country are already consecutive and sorted by date, and are grouped by the integer code of their country, which
+    # is much faster than grouping by its name
+    panel = covid.reset_index(drop=True)
+    locations = pd.Series(pd.factorize(panel['location'])[0])
+    countries = panel.groupby(locations, sort=False)
+    # the windows are measured in calendar days rather than rows, since days may be missing (e.g. quarantined)
+    dates = pd.to_datetime(panel['date'], format='%Y-%m-%d')
+    days_recorded = (dates - dates.groupby(locations, sort=False).transform('first')).dt.days + 1
+
+    for total, name in (('total_cases', 'cases'), ('total_deaths', 'deaths')):
+        daily = countries[total].diff().fillna(panel[total]).clip(lower=0)
+        by_date = daily.set_axis(dates).groupby(locations.to_numpy(), sort=False)
+        window_sums = {days: by_date.rolling(f'{days}D').sum().to_numpy() for days in (7, 14, 28)}
+        for window in (7, 28):
+            panel[f'New {name} ({window}-day avg)'] = window_sums[window] / days_recorded.clip(upper=window)
+        if name == 'cases':
+            last_week = pd.Series(window_sums[7])
+            previous_week = pd.Series(window_sums[14]) - last_week
+            panel['Weekly case growth'] = (last_week / previous_week.where(previous_week > 0) - 1).fillna(0)
+
+    panel['Case fatality ratio'] = (panel['total_deaths']
+                                    / panel['total_cases'].where(panel['total_cases'] > 0)).fillna(0)
+    panel['Doses per hundred'] = 100 * panel['total_vaccinations'] / panel['population']
+
+    pyramid = []
+    for level in levels:
+        period_ends = get_period_ends(panel, level)
+        periods = period_ends.groupby(locations[period_ends.index], sort=False)
+        pyramid.append(period_ends.assign(**{
+            'New cases': periods['total_cases'].diff().fillna(period_ends['total_cases']).clip(lower=0),
+            'New deaths': periods['total_deaths'].diff().fillna(period_ends['total_deaths']).clip(lower=0)
+        }))
+    return pd.concat(pyramid).set_index(['location', 'period'])[DERIVED_METRICS]
+
+
+# @check_contracts
+def to_country_data(metrics: pd.DataFrame) -> dict[str, dict[str, dict[str, Any]]]:
+    """Return the values in metrics, a DataFrame indexed by (country, period), in the format expected by
+    Tree.update_country_data.
+
+    >>> frame = pd.DataFrame({'location': ['India'], 'period': ['2021'], 'New cases': [5]})
+    >>> to_country_data(frame.set_index(['location', 'period']))
+    {'India': {'2021': {'New cases': 5}}}
+    """
+    # the columns are converted to lists of Python values at once, which is much faster than DataFrame.to_dict
+    names = list(metrics.columns)
+    rows = zip(*(metrics[name].tolist() for name in names))
+    new_data = {}
+    for country, period, values in zip(metrics.index.get_level_values(0).tolist(),
+                                       metrics.index.get_level_values(1).tolist(), rows):
+        new_data.setdefault(country, {})[period] = dict(zip(names, values))
+    return new_data
+
+
+# @check_contracts
+def add_derived_metrics(covid_tree: Tree, covid: pd.DataFrame) -> None:
+    """Add every metric in DERIVED_METRICS, computed from covid, to the COVID data of each country in covid_tree.
+
+    Preconditions:
+        - covid was returned by validate_covid_data for the DEFAULT_METRICS (or more)
+        - covid_tree was returned by build_covid_tree_from_panel(covid)
+    """
+    covid_tree.update_country_data(to_country_data(compute_derived_metrics(covid)))
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['pandas', 'typing', 'FINAL.modified_tree_FINAL']
+    })
@@ -1,7 +1,10 @@
+from functools import partial
+
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider, RadioButtons, Button
 from FINAL.modified_tree_FINAL import *
 from FINAL.data_wrangling import *
+from FINAL.derived_metrics import add_derived_metrics
 
 plt.style.use('dark_background')
 plt.rcParams['text.color'] = 'black'
@@ -9,28 +12,35 @@ plt.rcParams['text.color'] = 'black'
 world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
 clean_data("FINAL/owid-covid-data.csv")
 
-covid_tree = build_covid_tree("FINAL_TESTING_filtered_data_1.csv")
-
-
-months = {
-    1: "January",
-    2: "February",
-    3: "March",
-    4: "April",
-    5: "May",
-    6: "June",
-    7: "July",
-    8: "August",
-    9: "September",
-    10: "October",
-    11: "November",
-    12: "December"
+# the data is validated once, and the validated rows are used for both the Tree and the derived metrics
+covid, quarantine = validate_covid_data("FINAL_TESTING_filtered_data_1.csv")
+# the rows which failed validation are left out of the Tree, so they are written to a quarantine report instead
+quarantine.to_csv("FINAL_TESTING_quarantine.csv", index=False)
+if not quarantine.empty:
+    print(f'{len(quarantine)} rows failed validation and are not shown; see FINAL_TESTING_quarantine.csv')
+covid_tree = build_covid_tree_from_panel(covid)
+add_derived_metrics(covid_tree, covid)
+
+
+first_date = '2020-01-01'
+last_date = '2023-12-31'
+level = 'month'
+dates = get_periods(level, first_date, last_date)
+
+derived_options = {
+    'new cases': ('New cases', 'Blues'),
+    'new deaths': ('New deaths', 'Reds'),
+    'new cases (7-day avg)': ('New cases (7-day avg)', 'Blues'),
+    'new cases (28-day avg)': ('New cases (28-day avg)', 'Blues'),
+    'new deaths (7-day avg)': ('New deaths (7-day avg)', 'Reds'),
+    'new deaths (28-day avg)': ('New deaths (28-day avg)', 'Reds'),
+    'weekly case growth': ('Weekly case growth', 'Purples'),
+    'case fatality ratio': ('Case fatality ratio', 'Reds'),
+    'doses per hundred': ('Doses per hundred', 'Greens')
 }
 
-dates = []
-for i in range(2020, 2024):
-    for j in months:
-        dates.append(f'{months[j]} {i}')
+# the data of every (option, level) pair that has been plotted so far, so that each pair is only queried once
+option_cache = {}
 
 chosen_option = "cases"
 date_index = 0
@@ -60,48 +70,56 @@ def update_plot(chosen_option: str, date_index: int, region: str = "World") -> N
     This function is used to update the world map that we are going to visualize.
     Instance Attributes:
     - chosen_option (str) :The selected option from ‘cases’, ‘deaths’, ‘vaccinations’, ‘cases (pop.adjusted)’,
-     ‘deaths (pop.adjusted)’, ‘vaccinations (pop.adjusted)’
+     ‘deaths (pop.adjusted)’, ‘vaccinations (pop.adjusted)’ or one of the derived options in ‘derived_options’
     - date_index (int) : The selected index of the date from the list we made above named as ‘dates’
     - region (str) : The region that the user selects to see the visualizations. For this, the default value is ‘World’
 
     Preconditions:
     - chosen option must be from ‘cases’, ‘deaths’, ‘vaccinations’, ‘cases (pop.adjusted)’, ‘deaths (pop.adjusted)’,
-     ‘vaccinations (pop.adjusted)’
+     ‘vaccinations (pop.adjusted)’ or in ‘derived_options’
     - The date_index must be non-negative and from the list ‘dates’
 
     """
     ax_map.clear()
     ax_bar.clear()
 
-    dict1 = {}
     if chosen_option == "cases":
-        dict1 = {date: covid_tree.get_cases(date) for date in dates}
+        getter = covid_tree.get_cases
         colormap = 'Blues'
         title = 'Cases'
     elif chosen_option == "deaths":
-        dict1 = {date: covid_tree.get_deaths(date) for date in dates}
+        getter = covid_tree.get_deaths
         colormap = 'Reds'
         title = 'Deaths'
     elif chosen_option == 'vaccinations':
-        dict1 = {date: covid_tree.get_vaccinations(date) for date in dates}
+        getter = covid_tree.get_vaccinations
         colormap = 'Greens'
         title = 'Vaccinations'
 
     elif chosen_option == 'cases (pop. adjusted)':
-        dict1 = {date: covid_tree.get_cases_normalised(date) for date in dates}
+        getter = covid_tree.get_cases_normalised
         colormap = 'Blues'
         title = 'Cases (Pop. Adjusted)'
 
     elif chosen_option == 'deaths (pop. adjusted)':
-        dict1 = {date: covid_tree.get_deaths_normalised(date) for date in dates}
+        getter = covid_tree.get_deaths_normalised
         colormap = 'Reds'
         title = 'Deaths (Pop. Adjusted)'
 
     elif chosen_option == 'vaccinations (pop. adjusted)':
-        dict1 = {date: covid_tree.get_vaccinations_normalised(date) for date in dates}
+        getter = covid_tree.get_vaccinations_normalised
         colormap = 'Greens'
         title = 'Vaccinations (Pop. Adjusted)'
 
+    elif chosen_option in derived_options:
+        metric, colormap = derived_options[chosen_option]
+        getter = partial(covid_tree.get_metric, metric)
+        title = metric
+
+    if (chosen_option, level) not in option_cache:
+        option_cache[(chosen_option, level)] = {date: getter(date) for date in dates}
+    dict1 = option_cache[(chosen_option, level)]
+
     selected_date = dates[date_index]
 
     if region != "World":
@@ -150,7 +168,7 @@ def on_option_select(label: str) -> None:
 
     Preconditions:
     - label must be one of 'cases', 'deaths', 'vaccinations',
-      'cases (pop. adjusted)', 'deaths (pop. adjusted)', or 'vaccinations (pop. adjusted)'.
+      'cases (pop. adjusted)', 'deaths (pop. adjusted)', 'vaccinations (pop. adjusted)' or a key of 'derived_options'.
     """
 
     global chosen_option
@@ -191,6 +209,25 @@ def on_region_select(label: str) -> None:
     update_plot(chosen_option, date_index, region)
 
 
+def on_level_select(label: str) -> None:
+    """
+    Callback function for radio button selection of time levels.
+
+    Instance Attributes:
+    - label (str): The label of the selected level of the time pyramid.
+
+    Preconditions:
+    - label must be a valid level present in the list 'TIME_LEVELS'.
+
+    """
+    global level, dates
+    level = label
+    dates = get_periods(level, first_date, last_date)
+    slider.valmax = len(dates) - 1
+    slider.ax.set_xlim(slider.valmin, slider.valmax)
+    slider.set_val(0)
+
+
 # Define function to reset slider position to zero
 def reset_slider(event) -> None:
     """
@@ -203,9 +240,10 @@ def reset_slider(event) -> None:
     button.label.set_text('Play')
 
 
-ax_options = plt.axes((0.78, 0.3, 0.19, 0.25), facecolor='#ffffff')
+ax_options = plt.axes((0.78, 0.2, 0.19, 0.46), facecolor='#ffffff')
 radio_options = RadioButtons(ax_options, ('cases', 'deaths', 'vaccinations', 'cases (pop. adjusted)',
-                                          'deaths (pop. adjusted)', 'vaccinations (pop. adjusted)'),
+                                          'deaths (pop. adjusted)', 'vaccinations (pop. adjusted)',
+                                          *derived_options),
                              active=0, activecolor='grey')
 radio_options.on_clicked(on_option_select)
 
@@ -213,11 +251,15 @@ ax_slider = plt.axes((0.14, 0.02, 0.60, 0.03), facecolor='lightgoldenrodyellow')
 slider = Slider(ax_slider, 'Date', 0, len(dates) - 1, valinit=0, valstep=1, color='#e74c3c')
 slider.on_changed(on_slider_change)
 
-ax_region = plt.axes((0.78, 0.6, 0.19, 0.25), facecolor='#ffffff')
+ax_region = plt.axes((0.78, 0.68, 0.19, 0.2), facecolor='#ffffff')
 regions = ['World', 'Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America']
 radio_region = RadioButtons(ax_region, regions, active=0)
 radio_region.on_clicked(on_region_select)
 
+ax_level = plt.axes((0.78, 0.07, 0.19, 0.11), facecolor='#ffffff')
+radio_level = RadioButtons(ax_level, TIME_LEVELS, active=TIME_LEVELS.index(level))
+radio_level.on_clicked(on_level_select)
+
 ax_button = plt.axes((0.04, 0.025, 0.08, 0.03))
 button = Button(ax_button, '', color='white', hovercolor='#e74c3c')
 
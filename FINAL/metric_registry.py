@@ -0,0 +1,107 @@
+"""
+This module contains the registry of the COVID metrics that can be read from the OWID COVID data csv file.
+Each metric is registered under its name, which is also its key in the COVID data dictionaries stored in the Tree,
+and records the OWID column it is read from.
+
+Which metrics are loaded is configuration: clean_data and build_covid_tree only read and store the columns of the
+metrics they are given (DEFAULT_METRICS unless specified), and any other registered metric can be added to a Tree
+later, one column at a time, with data_wrangling.load_metrics. Supporting a new OWID column therefore only requires
+registering it here.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Metric:
+    """A COVID metric that can be read from a column of the OWID COVID data csv file.
+
+    Instance Attributes:
+        - name: the key of this metric in the COVID data dictionaries stored in the Tree
+        - column: the name of the OWID column this metric is read from
+        - integer: whether the values of this metric are whole numbers
+        - fill_missing: whether missing values of this metric are replaced by 0 when the data is cleaned
+        - carry_forward: whether a value of 0 is replaced by the last non-zero value recorded for the country,
+          for metrics which are only reported on some days
+        - cumulative: whether the values of this metric are running totals, which never decrease over time
+        - summable: whether the value of this metric for a continent or the world is the sum of the values of its
+          countries, for counts; ratios, percentages and indexes are not summable
+
+    Representation Invariants:
+        - self.name != ''
+        - self.column != ''
+    """
+    name: str
+    column: str
+    integer: bool = True
+    fill_missing: bool = True
+    carry_forward: bool = False
+    cumulative: bool = False
+    summable: bool = True
+
+
+METRICS: dict[str, Metric] = {}
+
+# the columns identifying the country and date of each row, which are always read
+KEY_COLUMNS = ['iso_code', 'continent', 'location', 'date']
+
+DEFAULT_METRICS = ('Total cases', 'Total deaths', 'Total vaccinations', 'Population')
+
+
+# @check_contracts
+def register_metric(metric: Metric) -> None:
+    """Add metric to the registry of metrics, replacing any metric registered under the same name.
+
+    >>> register_metric(Metric('New tests', 'new_tests'))
+    >>> METRICS['New tests'].column
+    'new_tests'
+    """
+    METRICS[metric.name] = metric
+
+
+# @check_contracts
+def get_columns(metric_names: tuple[str, ...]) -> list[str]:
+    """Return the OWID columns of the registered metrics with the given names, in the same order.
+
+    Preconditions:
+        - all(name in METRICS for name in metric_names)
+
+    >>> get_columns(DEFAULT_METRICS)
+    ['total_cases', 'total_deaths', 'total_vaccinations', 'population']
+    """
+    return [METRICS[name].column for name in metric_names]
+
+
+for _metric in [
+    Metric('Total cases', 'total_cases', cumulative=True),
+    Metric('Total deaths', 'total_deaths', cumulative=True),
+    Metric('Total vaccinations', 'total_vaccinations', carry_forward=True, cumulative=True),
+    Metric('Population', 'population', fill_missing=False),
+    Metric('Hospital patients', 'hosp_patients'),
+    Metric('ICU patients', 'icu_patients'),
+    Metric('Total tests', 'total_tests', carry_forward=True, cumulative=True),
+    Metric('People vaccinated', 'people_vaccinated', carry_forward=True, cumulative=True),
+    Metric('People fully vaccinated', 'people_fully_vaccinated', carry_forward=True, cumulative=True),
+    Metric('Total boosters', 'total_boosters', carry_forward=True, cumulative=True),
+    Metric('Excess mortality (cumulative)', 'excess_mortality_cumulative', integer=False, carry_forward=True,
+           summable=False),
+    Metric('Excess mortality (cumulative, absolute)', 'excess_mortality_cumulative_absolute',
+           integer=False, carry_forward=True),
+    Metric('Reproduction rate', 'reproduction_rate', integer=False, summable=False),
+    Metric('Stringency index', 'stringency_index', integer=False, summable=False)
+]:
+    register_metric(_metric)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['dataclasses']
+    })
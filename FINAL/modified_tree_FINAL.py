@@ -8,15 +8,46 @@ continent Tree's subtrees will contain Trees for each of the countries in the re
 continents. Finally, each country Tree will contain one subtree which will store that country's
 COVID data in a nested dictionary format.
 The format of COVID data dictionary is as follows:
-{<month + year>: {'Total cases': <cases>, 'Total deaths': <deaths>, 'Total vaccinations':
-<vaccinations>, 'Population': <population>}} (this will be the case for each month from
-January 2020 till April 2024, wherever the data is available).
+{<period>: {'Total cases': <cases>, 'Total deaths': <deaths>, 'Total vaccinations':
+<vaccinations>, 'Population': <population>}} (this will be the case for each period from
+January 2020 till April 2024, wherever the data is available). These are the default metrics; any
+other metric of metric_registry.METRICS can be stored in the same dictionaries under its name.
+The periods form a time pyramid: each day, week, month, quarter and year is a key of the
+dictionary (see get_period for the format of each level), and maps to the data recorded on
+the last day of that period. All levels are filled in while the csv file is read, so a query at
+a coarse level never has to aggregate the daily data.
+The csv file is validated before the Tree is built (see validate_covid_data), and rows which fail
+validation are left out of the Tree and reported instead.
 """
 from __future__ import annotations
 
-import csv
+import datetime
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import compress
 from typing import Any, Optional
 
+import pandas as pd
+
+from FINAL.metric_registry import DEFAULT_METRICS, METRICS, get_columns
+
+MONTHS = {
+    1: "January",
+    2: "February",
+    3: "March",
+    4: "April",
+    5: "May",
+    6: "June",
+    7: "July",
+    8: "August",
+    9: "September",
+    10: "October",
+    11: "November",
+    12: "December"
+}
+
+TIME_LEVELS = ['day', 'week', 'month', 'quarter', 'year']
+
 
 # from python_ta.contracts import check_contracts
 
@@ -248,9 +279,7 @@ Tree(7, [Tree(0, [Tree(111, [])])])])
 
         Preconditions:
             - not self.is_empty()
-            - month_year.split(' ')[0].lower() in ['january', 'february', 'march', 'april', 'may', 'june', 'july',
-            'august', 'september', 'october', 'november', 'december']
-            - month_year.split(' ')[1] in ['20', '21', '22', '23', '24']
+            - month_year is a period label returned by get_period, e.g. 'May 2021', 'Week 20 2021' or 'Q2 2021'
         """
         if self._subtrees[0]._subtrees == []:
             country_data = self._subtrees[0]._root
@@ -271,9 +300,7 @@ Tree(7, [Tree(0, [Tree(111, [])])])])
 
         Preconditions:
             - not self.is_empty()
-            - month_year.split(' ')[0].lower() in ['january', 'february', 'march', 'april', 'may', 'june', 'july',
-            'august', 'september', 'october', 'november', 'december']
-            - month_year.split(' ')[1] in ['20', '21', '22', '23', '24']
+            - month_year is a period label returned by get_period, e.g. 'May 2021', 'Week 20 2021' or 'Q2 2021'
         """
         if self._subtrees[0]._subtrees == []:
             country_data = self._subtrees[0]._root
@@ -294,9 +321,7 @@ Tree(7, [Tree(0, [Tree(111, [])])])])
 
         Preconditions:
             - not self.is_empty()
-            - month_year.split(' ')[0].lower() in ['january', 'february', 'march', 'april', 'may', 'june', 'july',
-            'august', 'september', 'october', 'november', 'december']
-            - month_year.split(' ')[1] in ['20', '21', '22', '23', '24']
+            - month_year is a period label returned by get_period, e.g. 'May 2021', 'Week 20 2021' or 'Q2 2021'
         """
         if self._subtrees[0]._subtrees == []:
             country_data = self._subtrees[0]._root
@@ -318,9 +343,7 @@ Tree(7, [Tree(0, [Tree(111, [])])])])
 
         Preconditions:
             - not self.is_empty()
-            - month_year.split(' ')[0].lower() in ['january', 'february', 'march', 'april', 'may', 'june', 'july',
-            'august', 'september', 'october', 'november', 'december']
-            - month_year.split(' ')[1] in ['20', '21', '22', '23', '24']
+            - month_year is a period label returned by get_period, e.g. 'May 2021', 'Week 20 2021' or 'Q2 2021'
         """
         if self._subtrees[0]._subtrees == []:
             country_data = self._subtrees[0]._root
@@ -344,9 +367,7 @@ Tree(7, [Tree(0, [Tree(111, [])])])])
 
         Preconditions:
             - not self.is_empty()
-            - month_year.split(' ')[0].lower() in ['january', 'february', 'march', 'april', 'may', 'june', 'july',
-            'august', 'september', 'october', 'november', 'december']
-            - month_year.split(' ')[1] in ['20', '21', '22', '23', '24']
+            - month_year is a period label returned by get_period, e.g. 'May 2021', 'Week 20 2021' or 'Q2 2021'
         """
         if self._subtrees[0]._subtrees == []:
             country_data = self._subtrees[0]._root
@@ -370,9 +391,7 @@ Tree(7, [Tree(0, [Tree(111, [])])])])
 
         Preconditions:
             - not self.is_empty()
-            - month_year.split(' ')[0].lower() in ['january', 'february', 'march', 'april', 'may', 'june', 'july',
-            'august', 'september', 'october', 'november', 'december']
-            - month_year.split(' ')[1] in ['20', '21', '22', '23', '24']
+            - month_year is a period label returned by get_period, e.g. 'May 2021', 'Week 20 2021' or 'Q2 2021'
         """
         if self._subtrees[0]._subtrees == []:
             country_data = self._subtrees[0]._root
@@ -388,65 +407,402 @@ Tree(7, [Tree(0, [Tree(111, [])])])])
                 cases_data.update(subtree.get_vaccinations_normalised(month_year))
             return cases_data
 
+    # @check_contracts
+    def get_metric(self, metric: str, month_year: str) -> dict[str, float]:
+        """Return a dictionary mapping country names to the value of <metric> recorded in that country for the date
+        (month and year) specified by month_year. Countries without a value for <metric> at that date are mapped to 0.
+
+        Preconditions:
+            - not self.is_empty()
+
+        >>> t = Tree('World', [Tree('Asia', [Tree('India', [Tree({'May 2021': {'New cases': 5}}, [])])])])
+        >>> t.get_metric('New cases', 'May 2021')
+        {'India': 5}
+        >>> t.get_metric('New deaths', 'May 2021')
+        {'India': 0}
+        """
+        if self._subtrees[0]._subtrees == []:
+            country_data = self._subtrees[0]._root
+            if month_year in country_data and metric in country_data[month_year]:
+                return {self._root: country_data[month_year][metric]}
+            else:
+                return {self._root: 0}
+        else:
+            metric_data = {}
+            for subtree in self._subtrees:
+                metric_data.update(subtree.get_metric(metric, month_year))
+            return metric_data
+
+    # @check_contracts
+    def get_country_data(self) -> dict[str, dict[str, dict[str, Any]]]:
+        """Return a dictionary mapping country names to the COVID data dictionary stored for that country.
+
+        Preconditions:
+            - not self.is_empty()
+
+        >>> t = Tree('World', [Tree('Asia', [Tree('India', [Tree({'2020': {'Total cases': 5}}, [])])])])
+        >>> t.get_country_data()
+        {'India': {'2020': {'Total cases': 5}}}
+        """
+        if self._subtrees[0]._subtrees == []:
+            return {self._root: self._subtrees[0]._root}
+        else:
+            country_data = {}
+            for subtree in self._subtrees:
+                country_data.update(subtree.get_country_data())
+            return country_data
+
+    # @check_contracts
+    def get_time_series(self, metric: str, periods: list[str]) -> dict[str, list[float]]:
+        """Return a dictionary mapping country names to the values of <metric> recorded in that country for each of
+        the given periods, in the same order. Periods without a value for <metric> are mapped to 0.
+
+        Preconditions:
+            - not self.is_empty()
+
+        >>> t = Tree('World', [Tree('Asia', [Tree('India', [Tree({'2020': {'Total cases': 5}}, [])])])])
+        >>> t.get_time_series('Total cases', ['2020', '2021'])
+        {'India': [5, 0]}
+        """
+        if self._subtrees[0]._subtrees == []:
+            country_data = self._subtrees[0]._root
+            return {self._root: [country_data[period].get(metric, 0) if period in country_data else 0
+                                 for period in periods]}
+        else:
+            series_data = {}
+            for subtree in self._subtrees:
+                series_data.update(subtree.get_time_series(metric, periods))
+            return series_data
+
+    # @check_contracts
+    def get_similar_countries(self, country: str, metric: str = 'Total cases', k: int = 5,
+                              date_range: tuple[str, str] = ('2020-01-01', '2023-12-31'), level: str = 'month',
+                              method: str = 'euclidean', band: Optional[int] = None) -> list[tuple[str, float]]:
+        """Return the k countries whose normalised time series of <metric> over date_range, at the given level of the
+        time pyramid, are nearest to that of <country>, with their distances, nearest first.
+
+        See similarity.SimilarityIndex for the available methods. The index built for each metric, level and date
+        range is cached, so only the first query for them reads the data stored in this tree.
+
+        Preconditions:
+            - not self.is_empty()
+            - country in self
+            - k >= 1
+            - level in TIME_LEVELS
+            - method in ['euclidean', 'correlation', 'dtw']
+        """
+        # imported here since the similarity module itself depends on this module
+        from FINAL.similarity import get_similarity_index
+
+        index = get_similarity_index(self, metric, date_range, level)
+        return index.nearest(country, k, method, band)
+
+    # @check_contracts
+    def update_country_data(self, new_data: dict[str, dict[str, dict[str, Any]]]) -> None:
+        """Merge new_data, which maps country names to {<month + year>: {<metric>: <value>}}, into the COVID data
+        stored for each country in this tree. Only dates already present in a country's data are updated.
+
+        The country's existing data dictionary is never mutated; it is replaced by an updated copy.
+
+        Preconditions:
+            - not self.is_empty()
+
+        >>> t = Tree('World', [Tree('Asia', [Tree('India', [Tree({'May 2021': {'Total cases': 5}}, [])])])])
+        >>> t.update_country_data({'India': {'May 2021': {'New cases': 2}}})
+        >>> t.get_metric('New cases', 'May 2021')
+        {'India': 2}
+        """
+        if self._subtrees[0]._subtrees == []:
+            if self._root in new_data:
+                updates = new_data[self._root]
+                country_data = self._subtrees[0]._root
+                self._subtrees[0] = Tree({key: {**values, **updates.get(key, {})}
+                                          for key, values in country_data.items()}, [])
+        else:
+            for subtree in self._subtrees:
+                subtree.update_country_data(new_data)
+
+    # @check_contracts
+    def replace_country_data(self, new_data: dict[str, dict[str, dict[str, Any]]]) -> None:
+        """Replace the COVID data stored for each country in new_data, which maps country names to COVID data
+        dictionaries, by its value in new_data.
+
+        Preconditions:
+            - not self.is_empty()
+
+        >>> t = Tree('World', [Tree('Asia', [Tree('India', [Tree({'2020': {'Total cases': 5}}, [])])])])
+        >>> t.replace_country_data({'India': {'2020': {'Total cases': 6}}})
+        >>> t.get_cases('2020')
+        {'India': 6}
+        """
+        if self._subtrees[0]._subtrees == []:
+            if self._root in new_data:
+                self._subtrees[0] = Tree(new_data[self._root], [])
+        else:
+            for subtree in self._subtrees:
+                subtree.replace_country_data(new_data)
+
+    # @check_contracts
+    def copy(self) -> Tree:
+        """Return a copy of this tree which shares the COVID data of each country with this tree.
+
+        Since the methods of this class replace the COVID data of a country rather than mutating it, changing the
+        COVID data of a country in the copy does not change it in this tree, and vice versa.
+
+        Preconditions:
+            - not self.is_empty()
+
+        >>> t = Tree('World', [Tree('Asia', [Tree('India', [Tree({'2020': {'Total cases': 5}}, [])])])])
+        >>> t_copy = t.copy()
+        >>> t_copy.replace_country_data({'India': {'2020': {'Total cases': 6}}})
+        >>> t.get_cases('2020'), t_copy.get_cases('2020')
+        ({'India': 5}, {'India': 6})
+        """
+        if self._subtrees[0]._subtrees == []:
+            return Tree(self._root, [self._subtrees[0]])
+        else:
+            return Tree(self._root, [subtree.copy() for subtree in self._subtrees])
+
 
 # @check_contracts
-def build_covid_tree(covid_data_csv_file: str) -> Tree:
-    """Return a Tree containing the COVID data given in covid_data_csv_file.
+def build_covid_tree(covid_data_csv_file: str, levels: tuple[str, ...] = tuple(TIME_LEVELS),
+                     metrics: tuple[str, ...] = DEFAULT_METRICS, quarantine_csv_file: Optional[str] = None) -> Tree:
+    """Return a Tree containing the COVID data given in covid_data_csv_file, with a key in each country's COVID
+    data dictionary for every period of each of the given levels of the time pyramid. Only the given registered
+    metrics are stored.
+
+    Rows of covid_data_csv_file which fail validation are left out of the Tree. If quarantine_csv_file is given,
+    the quarantine report of these rows is written to it.
 
     Preconditions:
         - covid_data_csv_file is the path to a csv file containing COVID data
+        - all(level in TIME_LEVELS for level in levels)
+        - all(name in METRICS for name in metrics)
+        - the columns of the given metrics are in covid_data_csv_file
+    """
+    covid, quarantine = validate_covid_data(covid_data_csv_file, metrics)
+    if quarantine_csv_file is not None:
+        quarantine.to_csv(quarantine_csv_file, index=False)
+    return build_covid_tree_from_panel(covid, levels, metrics)
+
+
+# @check_contracts
+def build_covid_tree_from_panel(covid: pd.DataFrame, levels: tuple[str, ...] = tuple(TIME_LEVELS),
+                                metrics: tuple[str, ...] = DEFAULT_METRICS) -> Tree:
+    """Return a Tree containing the COVID data in covid, the rows returned by validate_covid_data, with a key in each
+    country's COVID data dictionary for every period of each of the given levels of the time pyramid. Only the given
+    registered metrics are stored.
+
+    A day which ends periods at several levels has a single dictionary of values, shared by all of these periods.
+
+    Preconditions:
+        - all(level in TIME_LEVELS for level in levels)
+        - all(name in METRICS for name in metrics)
+        - covid was returned by validate_covid_data for the given metrics (or more)
+
+    >>> covid = pd.DataFrame({'continent': ['Asia'] * 2, 'location': ['India'] * 2,
+    ...                       'date': ['2020-12-31', '2021-01-01'], 'total_cases': [1, 2]})
+    >>> covid_tree = build_covid_tree_from_panel(covid, ('day', 'year'), ('Total cases',))
+    >>> india = covid_tree.get_country_data()['India']
+    >>> india['2020']
+    {'Total cases': 1}
+    >>> india['2021'] is india['2021-01-01']
+    True
     """
+    names = list(metrics)
+    covid = covid.rename(columns={METRICS[name].column: name for name in metrics}).reset_index(drop=True)
+
+    # the data of a period is the data of the last day recorded in it, for each level of the time pyramid
+    period_ends = [get_period_ends(covid, level) for level in levels]
+    end_days = covid.loc[sorted(set().union(*(ends.index for ends in period_ends))), names]
+    records = dict(zip(end_days.index.tolist(), (dict(zip(names, values))
+                                        for values in zip(*(end_days[name].tolist() for name in names)))))
+    country_data = {country: {} for country in covid['location'].unique()}
+    for ends in period_ends:
+        for country, period, row in zip(ends['location'].tolist(), ends['period'].tolist(), ends.index.tolist()):
+            country_data[country][period] = records[row]
+
     covid_tree = Tree('World', [])
-    months = {
-        1: "January",
-        2: "February",
-        3: "March",
-        4: "April",
-        5: "May",
-        6: "June",
-        7: "July",
-        8: "August",
-        9: "September",
-        10: "October",
-        11: "November",
-        12: "December"
-    }
-
-    with open(covid_data_csv_file) as csv_file:
-        reader = csv.reader(csv_file)
-        next(reader)  # skip the header row
-        country = "Afghanistan"
-        continent = "Asia"
-        country_data = {}
-        total_vaccinations = 0
-        for row in reader:
-            if row[3] != country:
-                # add data to tree (insert sequence)
-                covid_tree.insert_sequence([continent, country, country_data])
-                country_data = {}
-                total_vaccinations = 0
-
-            # read new row
-            month, year = get_date(row[4])
-            continent = row[2]
-            country = row[3]
-            total_cases = int(row[5])
-            total_deaths = int(row[6])
-            if int(row[7]) != 0:
-                total_vaccinations = int(row[7])
-            key = months[month] + " " + str(year)
-            country_data[key] = {
-                "Total cases": total_cases,
-                "Total deaths": total_deaths,
-                "Total vaccinations": total_vaccinations,
-                "Population": int(row[8])
-            }
-        # insert the last country's data
-        covid_tree.insert_sequence([continent, country, country_data])
+    countries = covid.drop_duplicates('location')
+    for continent, country in zip(countries['continent'], countries['location']):
+        covid_tree.insert_sequence([continent, country, country_data[country]])
 
     return covid_tree
 
 
+# @check_contracts
+def validate_covid_data(covid_data_csv_file: str,
+                        metrics: tuple[str, ...] = DEFAULT_METRICS) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return the rows of covid_data_csv_file which pass validation, and a quarantine report of the rows which do not.
+
+    Only the continent, location and date columns and the columns of the given registered metrics are read, one
+    whole column at a time, and only empty values are read as missing. See validate_covid_columns for the checks and
+    the format of the quarantine report.
+
+    Preconditions:
+        - covid_data_csv_file is the path to a csv file containing COVID data
+        - all(name in METRICS for name in metrics)
+    """
+    key_columns = ['continent', 'location', 'date']
+    metric_columns = get_columns(metrics)
+    # the types of the metric columns are inferred by the csv parser, so only a column which holds a value that is not
+    # a number is read as text
+    raw = pd.read_csv(covid_data_csv_file, usecols=key_columns + metric_columns, keep_default_na=False, na_values=[''],
+                      dtype={column: str for column in key_columns})
+    return validate_covid_columns(raw, metrics)
+
+
+# @check_contracts
+def validate_covid_columns(raw: pd.DataFrame, metrics: tuple[str, ...]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return the rows of raw, the columns read from a csv file of COVID data, which pass validation, and a
+    quarantine report of the rows which do not.
+
+    Every check is done on whole columns at once. A row fails validation if:
+        - its continent, location or date is missing, or its date is not a valid YYYY-MM-DD date
+        - the value of one of its metrics is missing, or not a number (a whole number, for integer metrics)
+        - its population is not positive
+        - it is not in the largest block of consecutive rows of its country (the first one, if there are several),
+          its continent is not the continent of the first row of that block, or its date is not after the date of its
+          country's previous row
+        - the value of one of its cumulative metrics is not in the longest non-decreasing sequence of values of that
+          metric in its country's rows (see _longest_non_decreasing), so a one-off spike or a dip is quarantined
+          rather than the rows around it
+    In the rows which pass validation, the values of metrics which are carried forward have been carried forward.
+    The quarantine report contains the line number in the csv file of each row which fails validation (assuming
+    raw holds every row after the header), its values as read, and the reasons it failed. Missing values in raw are
+    NaN.
+
+    Preconditions:
+        - all(name in METRICS for name in metrics)
+        - all(column in raw.columns for column in ['continent', 'location', 'date'] + get_columns(metrics))
+
+    India's total cases are revised down on its third day, and spike on its sixth day.
+
+    >>> raw = pd.DataFrame({
+    ...     'continent': ['Europe', 'Europe'] + ['Asia'] * 8 + ['Europe'] * 3 + ['Asia'],
+    ...     'location': ['India', 'France'] + ['India'] * 8 + ['France'] * 3 + ['India'],
+    ...     'date': ['2020-01-08', '2020-01-09'] + ['2020-01-0' + str(day) for day in range(1, 9)]
+    ...             + ['2020-01-01', '2020-01-02', '2020-01-03', '2020-01-09'],
+    ...     'total_cases': ['8', '9', '10', '20', '15', '18', '25', '30000', '30', '35', '1', '2', 'x', '40'],
+    ...     'population': ['5', '7'] + ['5'] * 8 + ['7', '0', '7', '5']})
+    >>> valid, quarantine = validate_covid_columns(raw, ('Total cases', 'Population'))
+    >>> valid['total_cases'].tolist()
+    [10, 15, 18, 25, 30, 35, 1]
+    >>> for line, reason in quarantine[['line', 'reason']].values.tolist():
+    ...     print(line, reason)
+    2 country rows not grouped; inconsistent continent
+    3 country rows not grouped
+    5 total_cases out of sequence
+    9 total_cases out of sequence
+    13 non-positive population
+    14 malformed total_cases
+    15 country rows not grouped
+    """
+    key_columns = ['continent', 'location', 'date']
+    covid = raw[key_columns].copy()
+    dates = pd.to_datetime(covid['date'], format='%Y-%m-%d', errors='coerce')
+    missing = covid.isna().any(axis=1)
+    checks = {'missing continent, location or date': missing,
+              'invalid date': dates.isna() & covid['date'].notna()}
+    for name in metrics:
+        metric = METRICS[name]
+        values = pd.to_numeric(raw[metric.column], errors='coerce')
+        malformed = values.isna()
+        if metric.integer:
+            malformed |= values % 1 != 0
+        checks[f'malformed {metric.column}'] = malformed
+        covid[metric.column] = values
+    if 'Population' in metrics:
+        checks['non-positive population'] = covid[METRICS['Population'].column] <= 0
+
+    # the countries and continents are compared by their integer codes, which is much faster than comparing strings
+    locations = pd.Series(pd.factorize(covid['location'])[0], index=covid.index)
+    continents = pd.Series(pd.factorize(covid['continent'])[0], index=covid.index)
+
+    # only the largest (and of those, the first) block of consecutive rows of each country is kept, so a stray row
+    # only quarantines itself, whether it comes before or after the rest of its country's rows
+    blocks = (locations != locations.shift()).cumsum()
+    block_sizes = blocks.map(blocks.value_counts())
+    largest_blocks = blocks.where(block_sizes == block_sizes.groupby(locations, sort=False).transform('max'))
+    not_grouped = blocks != largest_blocks.groupby(locations, sort=False).transform('min')
+    checks['country rows not grouped'] = not_grouped
+    # the continent of a country is the continent of the first row of its kept block, so a stray row with another
+    # continent does not quarantine the rest of its country's rows
+    expected_continents = continents.where(~not_grouped).groupby(locations, sort=False).transform('first')
+    checks['inconsistent continent'] = continents != expected_continents
+    grouped_dates = dates[~not_grouped]
+    out_of_order = grouped_dates <= grouped_dates.groupby(locations[~not_grouped], sort=False).shift()
+    checks['date not after previous date'] = out_of_order.reindex(covid.index, fill_value=False)
+
+    # the cumulative checks keep the longest non-decreasing sequence of values of each country among the rows which
+    # passed the other checks, so the valid rows of a cumulative metric never decrease. Only the countries whose
+    # values decrease somewhere are checked row by row
+    checks = pd.DataFrame(checks)
+    passed = ~checks.any(axis=1)
+    covid = covid[passed].copy()
+    passed_locations = locations[passed]
+    cumulative_checks = {}
+    for name in metrics:
+        metric = METRICS[name]
+        if metric.carry_forward:
+            column = covid[metric.column]
+            covid[metric.column] = column.where(column != 0).groupby(passed_locations, sort=False).ffill().fillna(0)
+        if metric.cumulative:
+            column = covid[metric.column]
+            decreases = column.groupby(passed_locations, sort=False).diff() < 0
+            decreasing = decreases.groupby(passed_locations, sort=False).transform('any')
+            out_of_sequence = pd.Series(False, index=column.index)
+            for _, values in column[decreasing].groupby(passed_locations[decreasing], sort=False):
+                out_of_sequence[values.index] = [not kept for kept in _longest_non_decreasing(values.tolist())]
+            cumulative_checks[f'{metric.column} out of sequence'] = out_of_sequence.reindex(raw.index,
+                                                                                          fill_value=False)
+    checks = pd.concat([checks, pd.DataFrame(cumulative_checks, index=raw.index, dtype=bool)], axis=1)
+
+    # the reasons are only joined for the (few) rows which failed a check
+    quarantined = checks.any(axis=1)
+    reasons = ['; '.join(compress(checks.columns, failed)) for failed in checks[quarantined].to_numpy()]
+    quarantine = raw[quarantined].assign(reason=reasons)
+    quarantine.insert(0, 'line', quarantine.index + 2)  # the header is line 1
+
+    covid = covid[~quarantined[covid.index]]
+    integer_columns = [METRICS[name].column for name in metrics if METRICS[name].integer]
+    covid = covid.astype({column: 'int64' for column in integer_columns})
+    return covid.reset_index(drop=True), quarantine.reset_index(drop=True)
+
+
+# @check_contracts
+def _longest_non_decreasing(values: list[float]) -> list[bool]:
+    """Return whether each of values is in the longest non-decreasing subsequence of values. If there are several,
+    the one whose last values are smallest is chosen, so a later value which revises an earlier one down is kept.
+
+    >>> _longest_non_decreasing([10, 20, 30000, 40, 50])
+    [True, True, False, True, True]
+    >>> _longest_non_decreasing([10, 20, 15, 18, 25])
+    [True, False, True, True, True]
+    """
+    # tails[k] is the index of the smallest last value of the non-decreasing subsequences of length k + 1 so far, and
+    # previous[i] is the index of the value before values[i] in the longest such subsequence ending with values[i]
+    tails = []
+    tail_values = []
+    previous = []
+    for i, value in enumerate(values):
+        length = bisect_right(tail_values, value)
+        previous.append(tails[length - 1] if length > 0 else -1)
+        if length == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[length] = i
+            tail_values[length] = value
+
+    kept = [False] * len(values)
+    i = tails[-1] if tails != [] else -1
+    while i != -1:
+        kept[i] = True
+        i = previous[i]
+    return kept
+
+
 # @check_contracts
 def get_date(date: str) -> tuple[int, int]:
     """
@@ -458,6 +814,76 @@ def get_date(date: str) -> tuple[int, int]:
     return (month, year)
 
 
+# @check_contracts
+@lru_cache(maxsize=None)
+def get_period(date: str, level: str) -> str:
+    """
+    Return the label of the period at the given level of the time pyramid that contains <date>, given in
+    string format as YYYY-MM-DD. Weeks are ISO weeks.
+
+    Preconditions:
+        - level in TIME_LEVELS
+
+    >>> [get_period('2021-05-17', level) for level in TIME_LEVELS]
+    ['2021-05-17', 'Week 20 2021', 'May 2021', 'Q2 2021', '2021']
+    >>> get_period('2021-01-01', 'week')
+    'Week 53 2020'
+    """
+    month, year = get_date(date)
+    if level == 'day':
+        return date
+    elif level == 'week':
+        iso_year, iso_week, _ = datetime.date.fromisoformat(date).isocalendar()
+        return f'Week {iso_week} {iso_year}'
+    elif level == 'month':
+        return f'{MONTHS[month]} {year}'
+    elif level == 'quarter':
+        return f'Q{(month - 1) // 3 + 1} {year}'
+    else:
+        return str(year)
+
+
+# @check_contracts
+def get_periods(level: str, start_date: str, end_date: str) -> list[str]:
+    """
+    Return the labels, in chronological order, of the periods at the given level of the time pyramid
+    which contain a date from <start_date> to <end_date> (inclusive), both given in string format as YYYY-MM-DD.
+
+    Preconditions:
+        - level in TIME_LEVELS
+        - start_date <= end_date
+
+    >>> get_periods('quarter', '2020-02-10', '2020-12-31')
+    ['Q1 2020', 'Q2 2020', 'Q3 2020', 'Q4 2020']
+    >>> len(get_periods('month', '2020-01-01', '2023-12-31'))
+    48
+    """
+    periods = []
+    day = datetime.date.fromisoformat(start_date)
+    end = datetime.date.fromisoformat(end_date)
+    while day <= end:
+        period = get_period(day.isoformat(), level)
+        if periods == [] or periods[-1] != period:
+            periods.append(period)
+        day += datetime.timedelta(days=1)
+    return periods
+
+
+# @check_contracts
+def get_period_ends(panel: pd.DataFrame, level: str) -> pd.DataFrame:
+    """Return the rows of panel recorded on the last day of each country's periods at the given level of the time
+    pyramid, with the label of their period in a new 'period' column.
+
+    Preconditions:
+        - level in TIME_LEVELS
+        - 'location' in panel.columns and 'date' in panel.columns
+        - the rows of each country in panel are sorted by date
+    """
+    # each period label is computed once per distinct date rather than once per row
+    periods = {date: get_period(date, level) for date in panel['date'].unique()}
+    return panel.assign(period=panel['date'].map(periods)).drop_duplicates(['location', 'period'], keep='last')
+
+
 if __name__ == '__main__':
     import doctest
 
@@ -468,7 +894,7 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'max-line-length': 120,
         'max-nested-blocks': 4,
-        'extra-imports': ['csv']
+        'extra-imports': ['bisect', 'datetime', 'functools', 'itertools', 'pandas', 'FINAL.metric_registry']
     })
 
     # python_ta.check_all(config={
@@ -0,0 +1,198 @@
+"""
+This module contains the SimilarityIndex class, which is used to find the countries whose COVID trajectories
+(e.g. of cases or deaths) look like a given country's.
+
+An index stores the time series of one metric over a range of periods for every country in the COVID data Tree as
+the rows of a NumPy matrix. Each row is normalised (z-scored), so that countries are compared by the shape of their
+curves rather than by their size. The pairwise distances between all countries are computed in batched NumPy form
+and cached, so that once an index is built, finding the nearest countries to any country only needs a sort of one
+row of the distance matrix. Indexes are cached per Tree by get_similarity_index.
+"""
+from __future__ import annotations
+
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+import numpy as np
+
+from FINAL.modified_tree_FINAL import Tree, get_periods
+
+# the indexes built so far for each Tree, keyed by (metric, date range, level)
+_INDEXES: WeakKeyDictionary[Tree, dict[tuple, SimilarityIndex]] = WeakKeyDictionary()
+
+
+# @check_contracts
+class SimilarityIndex:
+    """A matrix of normalised time series of one metric, with one row per country, and the distances between them.
+
+    The available methods of measuring distance are:
+        - 'euclidean': the Euclidean distance between the normalised series
+        - 'correlation': 1 minus the Pearson correlation between the series
+        - 'dtw': the dynamic time warping distance between the normalised series, where a period may only be matched
+          with periods at most <band> periods away from it (a Sakoe-Chiba band)
+
+    Instance Attributes:
+        - countries: the names of the countries in this index, in the order of the rows of series
+        - periods: the labels of the periods in this index, in the order of the columns of series
+        - series: the normalised time series of each country
+
+    Representation Invariants:
+        - self.series.shape == (len(self.countries), len(self.periods))
+
+    In this example Japan's cases have the same shape as India's, ten times larger, and Nepal's are India's reversed.
+
+    >>> def country_tree(country: str, cases: list[int]) -> Tree:
+    ...     return Tree(country, [Tree({str(2020 + i): {'Total cases': cases[i]} for i in range(len(cases))}, [])])
+    >>> covid_tree = Tree('World', [Tree('Asia', [country_tree('India', [1, 2, 3, 4]),
+    ...                                           country_tree('Japan', [10, 20, 30, 40]),
+    ...                                           country_tree('Nepal', [4, 3, 2, 1]),
+    ...                                           country_tree('Laos', [1, 1, 1, 5])])])
+    >>> index = SimilarityIndex(covid_tree, 'Total cases', ['2020', '2021', '2022', '2023'])
+    >>> index.countries
+    ['India', 'Japan', 'Nepal', 'Laos']
+    >>> index.distances('India').round(2).tolist()
+    [0.0, 0.0, 4.0, 1.34]
+    >>> index.distances('India', 'correlation').round(2).tolist()
+    [0.0, 0.0, 2.0, 0.23]
+    >>> [(country, round(distance, 2)) for country, distance in index.nearest('India', 2)]
+    [('Japan', 0.0), ('Laos', 1.34)]
+    >>> [(country, round(distance, 2)) for country, distance in index.nearest('India', 5, 'dtw', band=1)]
+    [('Japan', 0.0), ('Laos', 1.34), ('Nepal', 4.0)]
+    """
+    countries: list[str]
+    periods: list[str]
+    series: np.ndarray
+    # Private Instance Attributes:
+    #   - _rows: maps each country to its row in self.series
+    #   - _distances: the distance matrices computed so far, keyed by method
+    #   - _dtw_distances: the rows of DTW distances computed so far, keyed by (country, band)
+    _rows: dict[str, int]
+    _distances: dict[str, np.ndarray]
+    _dtw_distances: dict[tuple[str, int], np.ndarray]
+
+    def __init__(self, covid_tree: Tree, metric: str, periods: list[str]) -> None:
+        """Initialize a new SimilarityIndex of the time series of <metric> over the given periods for every country
+        in covid_tree.
+
+        Preconditions:
+            - periods != []
+        """
+        series_data = covid_tree.get_time_series(metric, periods)
+        self.countries = list(series_data)
+        self.periods = periods
+        self._rows = {country: row for row, country in enumerate(self.countries)}
+
+        series = np.array(list(series_data.values()), dtype=float).reshape(len(self.countries), len(periods))
+        deviations = series.std(axis=1, keepdims=True)
+        # a flat series has no shape to compare, so it is normalised to all zeros
+        self.series = (series - series.mean(axis=1, keepdims=True)) / np.where(deviations > 0, deviations, 1)
+
+        self._distances = {}
+        self._dtw_distances = {}
+
+    def distances(self, country: str, method: str = 'euclidean', band: Optional[int] = None) -> np.ndarray:
+        """Return the distances from <country> to every country in this index, in the order of self.countries.
+
+        If band is None, the DTW band is a tenth of the number of periods (and at least 1).
+
+        Preconditions:
+            - country in self.countries
+            - method in ['euclidean', 'correlation', 'dtw']
+            - band is None or band >= 0
+        """
+        row = self._rows[country]
+        if method == 'dtw':
+            if band is None:
+                band = max(1, len(self.periods) // 10)
+            if (country, band) not in self._dtw_distances:
+                self._dtw_distances[(country, band)] = _dtw(self.series[row], self.series, band)
+            return self._dtw_distances[(country, band)]
+
+        if method not in self._distances:
+            if method == 'euclidean':
+                squared_norms = (self.series ** 2).sum(axis=1)
+                squared = squared_norms[:, None] + squared_norms[None, :] - 2 * self.series @ self.series.T
+                self._distances[method] = np.sqrt(np.clip(squared, 0, None))
+            else:
+                # the rows are z-scored, so their correlations are their scaled dot products
+                self._distances[method] = 1 - self.series @ self.series.T / len(self.periods)
+        return self._distances[method][row]
+
+    def nearest(self, country: str, k: int = 5, method: str = 'euclidean',
+                band: Optional[int] = None) -> list[tuple[str, float]]:
+        """Return the k countries nearest to <country> (excluding <country> itself) with their distances,
+        nearest first.
+
+        Preconditions:
+            - country in self.countries
+            - k >= 1
+            - method in ['euclidean', 'correlation', 'dtw']
+        """
+        distances = self.distances(country, method, band).copy()
+        distances[self._rows[country]] = np.inf
+        k = min(k, len(self.countries) - 1)
+        nearest = np.argpartition(distances, k - 1)[:k] if k > 0 else np.array([], dtype=int)
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return [(self.countries[row], float(distances[row])) for row in nearest]
+
+
+# @check_contracts
+def _dtw(query: np.ndarray, series: np.ndarray, band: int) -> np.ndarray:
+    """Return the dynamic time warping distances from query to each row of series, only matching periods at most
+    <band> periods apart. The rows are compared all at once, so the dynamic programme is only iterated over the
+    cells of the band.
+
+    Preconditions:
+        - series.shape[1] == query.shape[0]
+        - band >= 0
+
+    >>> _dtw(np.array([0.0, 1.0, 0.0]), np.array([[0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]), 1).tolist()
+    [0.0, 1.0]
+    """
+    length = query.shape[0]
+    previous = np.full((series.shape[0], length + 1), np.inf)
+    previous[:, 0] = 0
+    for i in range(1, length + 1):
+        current = np.full_like(previous, np.inf)
+        for j in range(max(1, i - band), min(length, i + band) + 1):
+            cost = (query[i - 1] - series[:, j - 1]) ** 2
+            current[:, j] = cost + np.minimum(np.minimum(previous[:, j], previous[:, j - 1]), current[:, j - 1])
+        previous = current
+    return np.sqrt(previous[:, length])
+
+
+# @check_contracts
+def get_similarity_index(covid_tree: Tree, metric: str, date_range: tuple[str, str], level: str) -> SimilarityIndex:
+    """Return the SimilarityIndex of <metric> in covid_tree over the periods at the given level of the time pyramid
+    which contain a date in date_range, building it only if it has not been built before.
+
+    Since indexes are cached, an index built before the values of <metric> in covid_tree change must be
+    discarded with clear_similarity_indexes.
+
+    Preconditions:
+        - date_range[0] <= date_range[1]
+    """
+    indexes = _INDEXES.setdefault(covid_tree, {})
+    key = (metric, date_range, level)
+    if key not in indexes:
+        indexes[key] = SimilarityIndex(covid_tree, metric, get_periods(level, date_range[0], date_range[1]))
+    return indexes[key]
+
+
+# @check_contracts
+def clear_similarity_indexes(covid_tree: Tree) -> None:
+    """Discard every SimilarityIndex built for covid_tree."""
+    _INDEXES.pop(covid_tree, None)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['numpy', 'typing', 'weakref', 'FINAL.modified_tree_FINAL']
+    })
@@ -0,0 +1,180 @@
+"""
+This module contains the SnapshotStore class, which holds several versions (snapshots) of the COVID data Tree, such
+as one for each OWID release, and finds the differences between them.
+
+The values of each period, and the COVID data of each country, are interned: whenever a snapshot is added, the values
+of each period which are equal to values already in the store (in any snapshot) are replaced by those values, and
+the data of each country whose periods are all shared with a country's data already in the store is replaced by
+that data. So unchanged periods and countries are stored once however many snapshots hold them, even when a value
+is changed and later changed back, and appending new dates to a country only adds the periods which changed. Most
+periods are unchanged since the latest snapshot, so each period is first compared with the same period of the latest
+snapshot, and only the other periods are looked up by their contents. Snapshots are never mutated: checkout returns
+a copy which shares the COVID data of every country with the stored snapshot, and Tree methods replace the COVID
+data of a country rather than mutating it (copy-on-write).
+
+Since the stored data is shared, diffs compare it by identity first: countries whose data is the same object are
+skipped, and within the other countries only the periods whose values are different objects are compared metric
+by metric.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from FINAL.modified_tree_FINAL import Tree
+
+
+# @check_contracts
+class SnapshotStore:
+    """A collection of versions of the COVID data Tree, which share the COVID data they have in common.
+
+    Instance Attributes:
+        - versions: the names of the snapshots in this store, in the order they were added
+
+    Representation Invariants:
+        - len(self.versions) == len(set(self.versions))
+    """
+    versions: list[str]
+    # Private Instance Attributes:
+    #   - _snapshots: maps each version to its COVID data Tree
+    #   - _period_values: maps the key of the values of each period in this store (see _period_key) to those values
+    #   - _country_data: maps the periods of each country's COVID data in this store, with the identities of their
+    #     (interned) values, to that data
+    _snapshots: dict[str, Tree]
+    _period_values: dict[tuple, dict[str, Any]]
+    _country_data: dict[tuple, dict[str, dict[str, Any]]]
+
+    def __init__(self) -> None:
+        """Initialize a new empty SnapshotStore."""
+        self.versions = []
+        self._snapshots = {}
+        self._period_values = {}
+        self._country_data = {}
+
+    def add(self, version: str, covid_tree: Tree) -> None:
+        """Add covid_tree to this store as the snapshot named <version>.
+
+        The COVID data of covid_tree which is identical to data already in this store is replaced by the data in
+        this store, so covid_tree itself shares it afterwards. Later changes to covid_tree do not change the snapshot.
+
+        Preconditions:
+            - version not in self.versions
+            - not covid_tree.is_empty()
+
+        >>> store = SnapshotStore()
+        >>> store.add('v1', Tree('World', [Tree('Asia', [Tree('India', [Tree({'2020': {'Total cases': 1}}, [])])])]))
+        >>> new_data = {'2020': {'Total cases': 1}, '2021': {'Total cases': 2}}
+        >>> store.add('v2', Tree('World', [Tree('Asia', [Tree('India', [Tree(new_data, [])])])]))
+        >>> old_india = store.checkout('v1').get_country_data()['India']
+        >>> new_india = store.checkout('v2').get_country_data()['India']
+        >>> old_india['2020'] is new_india['2020']
+        True
+        """
+        latest = self._snapshots[self.versions[-1]].get_country_data() if self.versions != [] else {}
+        shared_data = {}
+        for country, data in covid_tree.get_country_data().items():
+            old_data = latest.get(country, {})
+            if data is old_data:
+                # the country was not changed since it was checked out of the latest snapshot
+                shared_data[country] = data
+                continue
+            periods = {}
+            unchanged = len(data) == len(old_data)
+            for period, values in data.items():
+                old_values = old_data.get(period)
+                if old_values is not values and old_values != values:
+                    old_values = self._period_values.setdefault(_period_key(values), values)
+                    unchanged = False
+                periods[period] = old_values
+            if unchanged:
+                shared_data[country] = old_data
+            else:
+                country_key = (tuple(periods), tuple(map(id, periods.values())))
+                shared_data[country] = self._country_data.setdefault(country_key, periods)
+        covid_tree.replace_country_data(shared_data)
+
+        self.versions.append(version)
+        self._snapshots[version] = covid_tree.copy()
+
+    def checkout(self, version: str) -> Tree:
+        """Return a copy of the snapshot named <version>, which can be changed without changing the snapshot.
+
+        Preconditions:
+            - version in self.versions
+        """
+        return self._snapshots[version].copy()
+
+    def changed_countries(self, old_version: str, new_version: str) -> list[str]:
+        """Return the countries whose COVID data differs between the snapshots named old_version and new_version,
+        including the countries in only one of them, in alphabetical order.
+
+        Preconditions:
+            - old_version in self.versions
+            - new_version in self.versions
+
+        >>> store = SnapshotStore()
+        >>> for version, cases in [('v1', 1), ('v2', 2), ('v3', 1)]:
+        ...     india = Tree('India', [Tree({'2020': {'Total cases': cases}}, [])])
+        ...     store.add(version, Tree('World', [Tree('Asia', [india])]))
+        >>> store.changed_countries('v1', 'v2'), store.changed_countries('v1', 'v3')
+        (['India'], [])
+        """
+        old_data = self._snapshots[old_version].get_country_data()
+        new_data = self._snapshots[new_version].get_country_data()
+        # the data of most unchanged countries is the same object, and the shared periods of the others are compared
+        # by identity first, so confirming the remaining countries by equality is cheap
+        return sorted(country for country in old_data.keys() | new_data.keys()
+                      if old_data.get(country) is not new_data.get(country)
+                      and old_data.get(country) != new_data.get(country))
+
+    def diff(self, old_version: str, new_version: str) -> list[tuple[str, str, str]]:
+        """Return the (country, period, metric) triples whose value differs between the snapshots named old_version
+        and new_version, including those with a value in only one of them, in sorted order.
+
+        Preconditions:
+            - old_version in self.versions
+            - new_version in self.versions
+
+        >>> store = SnapshotStore()
+        >>> store.add('v1', Tree('World', [Tree('Asia', [Tree('India', [Tree({'2020': {'Total cases': 1}}, [])])])]))
+        >>> new_data = {'2020': {'Total cases': 1}, '2021': {'Total cases': 2}}
+        >>> store.add('v2', Tree('World', [Tree('Asia', [Tree('India', [Tree(new_data, [])])])]))
+        >>> store.diff('v1', 'v2')
+        [('India', '2021', 'Total cases')]
+        """
+        old_data = self._snapshots[old_version].get_country_data()
+        new_data = self._snapshots[new_version].get_country_data()
+        changes = []
+        for country in self.changed_countries(old_version, new_version):
+            old_periods = old_data.get(country, {})
+            new_periods = new_data.get(country, {})
+            for period in old_periods.keys() | new_periods.keys():
+                old_values = old_periods.get(period, {})
+                new_values = new_periods.get(period, {})
+                if old_values is not new_values:
+                    changes.extend((country, period, metric) for metric in old_values.keys() | new_values.keys()
+                                   if old_values.get(metric) != new_values.get(metric))
+        return sorted(changes)
+
+
+# @check_contracts
+def _period_key(values: dict[str, Any]) -> tuple:
+    """Return a key identifying the contents of values, the metric values of a period. Values with the same metrics
+    in a different order have different keys, which only means they are stored twice.
+
+    >>> _period_key({'Total cases': 1, 'Total deaths': 0})
+    (('Total cases', 'Total deaths'), (1, 0))
+    """
+    return tuple(values), tuple(values.values())
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['typing', 'FINAL.modified_tree_FINAL']
+    })
@@ -0,0 +1,184 @@
+"""
+This module computes a summary report of the COVID data Tree without the matplotlib UI, for scheduled reporting.
+
+The report has one row for every region (the world, each continent and each country) and every period of the
+chosen levels of the time pyramid, and one column for every metric stored in the Tree, together with the population
+adjusted variant of each metric that can be summed over countries. The country rows are read from the Tree once;
+the continent and world rollups and the population adjusted variants are then computed for all regions and periods
+at once with grouped pandas operations. The report is run with:
+    python main.py report --output <file>
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+from typing import Any
+
+import pandas as pd
+
+from FINAL.derived_metrics import add_derived_metrics
+from FINAL.metric_registry import METRICS
+from FINAL.modified_tree_FINAL import TIME_LEVELS, Tree, build_covid_tree_from_panel, get_periods, validate_covid_data
+
+CONTINENTS = ['Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America']
+
+# the columns identifying the region and period of each row of the report
+ID_COLUMNS = ['region', 'region_type', 'continent', 'level', 'period']
+
+# the derived metrics which are ratios, so cannot be summed over countries
+RATIO_METRICS = ['Weekly case growth', 'Case fatality ratio', 'Doses per hundred']
+
+
+# @check_contracts
+def is_ratio(metric: str) -> bool:
+    """Return whether <metric> is a ratio (or an index), rather than a count which can be summed over countries.
+    The continent and world values of a ratio are the population weighted means of the country values.
+
+    >>> is_ratio('Total cases')
+    False
+    >>> is_ratio('Case fatality ratio')
+    True
+    >>> is_ratio('Excess mortality (cumulative, absolute)'), is_ratio('Stringency index')
+    (False, True)
+    """
+    return metric in RATIO_METRICS or (metric in METRICS and not METRICS[metric].summable)
+
+
+# @check_contracts
+def _flatten_countries(continent: str, country_data: dict[str, dict[str, dict[str, Any]]],
+                       periods: dict[str, list[str]]) -> pd.DataFrame:
+    """Return the report rows of the countries in country_data, which are all in <continent>, for the given periods
+    of each level of the time pyramid. Periods without data for a country are left out.
+    """
+    records = [{'region': country, 'region_type': 'country', 'continent': continent, 'level': level,
+                'period': period, **data[period]}
+               for country, data in country_data.items()
+               for level, level_periods in periods.items()
+               for period in level_periods if period in data]
+    return pd.DataFrame.from_records(records)
+
+
+# @check_contracts
+def build_summary(covid_tree: Tree, levels: list[str], date_range: tuple[str, str]) -> pd.DataFrame:
+    """Return the summary report of covid_tree for every period at the given levels of the time pyramid which
+    contains a date in date_range.
+
+    Preconditions:
+        - all(level in TIME_LEVELS for level in levels)
+        - date_range[0] <= date_range[1]
+
+    In this example the weekly case growth of Asia is the mean of its countries' weighted by population, while its
+    case fatality ratio is recomputed from its total cases and deaths.
+
+    >>> india = Tree('India', [Tree({'2021': {'Total cases': 10, 'Total deaths': 1, 'Population': 100,
+    ...                                       'Weekly case growth': 0.5, 'Case fatality ratio': 0.1}}, [])])
+    >>> nepal = Tree('Nepal', [Tree({'2021': {'Total cases': 60, 'Total deaths': 3, 'Population': 300,
+    ...                                       'Weekly case growth': 0.1, 'Case fatality ratio': 0.05}}, [])])
+    >>> report = build_summary(Tree('World', [Tree('Asia', [india, nepal])]), ['year'], ('2021-01-01', '2021-12-31'))
+    >>> report[['region', 'region_type']].values.tolist()
+    [['World', 'world'], ['Asia', 'continent'], ['India', 'country'], ['Nepal', 'country']]
+    >>> report['Total cases'].tolist(), report['Population'].tolist()
+    ([70, 70, 10, 60], [400, 400, 100, 300])
+    >>> report['Weekly case growth'].round(4).tolist(), report['Case fatality ratio'].round(4).tolist()
+    ([0.2, 0.2, 0.5, 0.1], [0.0571, 0.0571, 0.1, 0.05])
+    >>> report['Total cases (pop. adjusted)'].tolist()
+    [0.175, 0.175, 0.1, 0.2]
+    """
+    periods = {level: get_periods(level, date_range[0], date_range[1]) for level in levels}
+    region_trees = {continent: covid_tree.get_region_tree(continent.lower()) for continent in CONTINENTS}
+    continents = [continent for continent in CONTINENTS if region_trees[continent] is not None]
+    countries = pd.concat([_flatten_countries(continent, region_trees[continent].get_country_data(), periods)
+                           for continent in continents], ignore_index=True)
+
+    metrics = [column for column in countries.columns if column not in ID_COLUMNS]
+    counts = [metric for metric in metrics if not is_ratio(metric)]
+    ratios = [metric for metric in metrics if is_ratio(metric)]
+    population = countries['Population']
+
+    # sum the counts and the population weighted ratios of all countries in each continent, and in the world
+    summable = pd.concat([countries[['continent', 'level', 'period'] + counts],
+                          countries[ratios].mul(population, axis=0)], axis=1)
+    continent_rows = summable.groupby(['continent', 'level', 'period'], sort=False).sum().reset_index()
+    continent_rows['region'] = continent_rows['continent']
+    continent_rows['region_type'] = 'continent'
+    world_rows = summable.drop(columns='continent').groupby(['level', 'period'], sort=False).sum().reset_index()
+    world_rows['region'] = world_rows['continent'] = 'World'
+    world_rows['region_type'] = 'world'
+    rollups = pd.concat([world_rows, continent_rows], ignore_index=True)
+    rollup_population = rollups['Population'].where(rollups['Population'] > 0)
+    rollups[ratios] = rollups[ratios].div(rollup_population, axis=0).fillna(0)
+    if 'Case fatality ratio' in ratios:
+        total_cases = rollups['Total cases'].where(rollups['Total cases'] > 0)
+        rollups['Case fatality ratio'] = (rollups['Total deaths'] / total_cases).fillna(0)
+    if 'Doses per hundred' in ratios:
+        rollups['Doses per hundred'] = (100 * rollups['Total vaccinations'] / rollup_population).fillna(0)
+
+    report = pd.concat([rollups, countries], ignore_index=True)
+    report_population = report['Population'].where(report['Population'] > 0)
+    normalised = report[[metric for metric in counts if metric != 'Population']].div(report_population, axis=0)
+    normalised = normalised.fillna(0).add_suffix(' (pop. adjusted)')
+    return pd.concat([report[ID_COLUMNS + metrics], normalised], axis=1)
+
+
+# @check_contracts
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the command line arguments of the summary report to parser."""
+    parser.add_argument('--data', default='FINAL_TESTING_filtered_data_1.csv',
+                        help='the csv file written by data_wrangling.clean_data')
+    parser.add_argument('--output', required=True, help='the file to write the report to')
+    parser.add_argument('--quarantine', default=None,
+                        help='the csv file to write the rows of the data which failed validation to')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='the format of the report (parquet requires pyarrow)')
+    parser.add_argument('--levels', nargs='+', choices=TIME_LEVELS, default=['month'],
+                        help='the levels of the time pyramid to report')
+    parser.add_argument('--start', default='2020-01-01', help='the first date to report, as YYYY-MM-DD')
+    parser.add_argument('--end', default='2023-12-31', help='the last date to report, as YYYY-MM-DD')
+    parser.add_argument('--extra-metrics', nargs='+', choices=sorted(METRICS), default=[],
+                        help='registered metrics to load from the OWID file in addition to the default metrics')
+    parser.add_argument('--owid-file', default='FINAL/owid-covid-data.csv',
+                        help='the OWID csv file to load the extra metrics from')
+
+
+# @check_contracts
+def run_report(args: argparse.Namespace) -> None:
+    """Build the COVID data Tree once and write its summary report, as specified by the command line arguments."""
+    # checked before the data is loaded, so that a missing optional dependency fails fast
+    if args.format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise SystemExit('error: --format parquet requires pyarrow, which can be installed with: pip install pyarrow')
+    covid, quarantine = validate_covid_data(args.data)
+    if args.quarantine is not None:
+        quarantine.to_csv(args.quarantine, index=False)
+    if not quarantine.empty:
+        print(f'{len(quarantine)} rows failed validation and are left out of the report')
+    covid_tree = build_covid_tree_from_panel(covid)
+    add_derived_metrics(covid_tree, covid)
+    if args.extra_metrics != []:
+        # imported here since the data wrangling module needs geopandas, which the default report does not
+        from FINAL.data_wrangling import load_metrics
+
+        extra_quarantine = load_metrics(covid_tree, args.owid_file, tuple(args.extra_metrics))
+        if not extra_quarantine.empty:
+            print(f'{len(extra_quarantine)} rows of {args.owid_file} failed validation and are left out of the '
+                  f'extra metrics')
+
+    report = build_summary(covid_tree, args.levels, (args.start, args.end))
+    if args.format == 'parquet':
+        report.to_parquet(args.output, index=False)
+    else:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'extra-imports': ['argparse', 'importlib.util', 'pandas', 'typing', 'FINAL.derived_metrics',
+                          'FINAL.metric_registry', 'FINAL.modified_tree_FINAL', 'FINAL.data_wrangling'],
+        'allowed-io': ['run_report']
+    })
@@ -1,16 +1,34 @@
-"""Main file to execute the final project."""
-from FINAL import final_testing
+"""Main file to execute the final project.
+
+Run without arguments to open the interactive visualisation, or with the report subcommand
+(python main.py report --help) to write a summary report without the UI.
+"""
+import argparse
 
 if __name__ == "__main__":
-    final_testing.covid_visualisation()
+    parser = argparse.ArgumentParser(description='Pandemic Patterns: Navigating the Spread of Covid')
+    subparsers = parser.add_subparsers(dest='command')
+    report_parser = subparsers.add_parser('report', help='write the statistics of every region and period to a file')
+
+    from FINAL import summary_report
+
+    summary_report.add_arguments(report_parser)
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        summary_report.run_report(args)
+    else:
+        from FINAL import final_testing
+
+        final_testing.covid_visualisation()
 
-    import python_ta.contracts
+        import python_ta.contracts
 
-    python_ta.contracts.check_all_contracts()
+        python_ta.contracts.check_all_contracts()
 
-    # import doctest
-    # doctest.testmod()
+        # import doctest
+        # doctest.testmod()
 
-    import python_ta
+        import python_ta
 
-    python_ta.check_all()
+        python_ta.check_all()